@@ -1,15 +1,39 @@
 from minsearch import Index
 from sentence_transformers import SentenceTransformer
 import numpy as np
-from elasticsearch import Elasticsearch
+from elasticsearch import Elasticsearch, ApiError, helpers
 import os
+import hashlib
+import threading
 import json
 import logging
 import re
+import streamlit as st
 
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Inference backend for the embedding model: "torch" (default) or "onnx". The ONNX
+# backend needs sentence-transformers[onnx]; EMBEDDING_ONNX_FILE picks a specific
+# exported file, e.g. the int8 onnx/model_qint8_avx512_vnni.onnx for VNNI CPUs
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'torch')
+EMBEDDING_ONNX_FILE = os.getenv('EMBEDDING_ONNX_FILE')
+
+def embedding_model_key(model_name):
+    """Identify the model and backend that produce a vector, so cached vectors are never mixed"""
+    if EMBEDDING_BACKEND == 'onnx':
+        return f"{model_name}@onnx:{EMBEDDING_ONNX_FILE or 'default'}"
+    return model_name
+
+@st.cache_resource(show_spinner=False)
+def load_embedding_model(model_name):
+    """Load a SentenceTransformer once per process and share it across pages and reruns"""
+    logger.info(f"Loading embedding model: {model_name} ({EMBEDDING_BACKEND} backend)")
+    if EMBEDDING_BACKEND == 'onnx':
+        model_kwargs = {"file_name": EMBEDDING_ONNX_FILE} if EMBEDDING_ONNX_FILE else None
+        return SentenceTransformer(model_name, backend='onnx', model_kwargs=model_kwargs)
+    return SentenceTransformer(model_name)
+
 def clean_text(text):
     if not isinstance(text, str):
         logger.warning(f"Non-string input to clean_text: {type(text)}")
@@ -28,11 +52,16 @@ class DataProcessor:
         self.keyword_fields = keyword_fields
         self.all_fields = text_fields + keyword_fields
         self.text_index = Index(text_fields=text_fields, keyword_fields=keyword_fields)
-        self.embedding_model = SentenceTransformer(embedding_model)
+        self.embedding_model_name = embedding_model
+        self.embedding_model = load_embedding_model(embedding_model)
         self.documents = []
         self.embeddings = []
         self.index_built = False
         self.current_index_name = None
+        # Guards the shared document list and index build when videos are processed concurrently
+        self.lock = threading.Lock()
+        # Fuse hybrid results with Elasticsearch's RRF until the cluster rejects it
+        self.server_side_rrf = True
         
         elasticsearch_host = os.getenv('ELASTICSEARCH_HOST', 'localhost')
         elasticsearch_port = int(os.getenv('ELASTICSEARCH_PORT', 9200))
@@ -40,7 +69,23 @@ class DataProcessor:
         self.es = Elasticsearch([f'http://{elasticsearch_host}:{elasticsearch_port}'])
         logger.info(f"DataProcessor initialized with Elasticsearch at {elasticsearch_host}:{elasticsearch_port}")
 
-    def process_transcript(self, video_id, transcript_data):
+    def embed_document(self, video_id, text, db_handler=None):
+        """Encode a document, reusing the vector cached in SQLite for the same text and model"""
+        if db_handler is None:
+            return self.embedding_model.encode(text)
+
+        model_key = embedding_model_key(self.embedding_model_name)
+        content_hash = hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+        cached = db_handler.get_embedding(video_id, model_key, content_hash)
+        if cached is not None:
+            logger.info(f"Using cached {model_key} embedding for video {video_id}")
+            return np.frombuffer(cached, dtype=np.float32)
+
+        embedding = self.embedding_model.encode(text)
+        db_handler.add_embedding(video_id, model_key, content_hash, embedding.astype(np.float32).tobytes())
+        return embedding
+
+    def process_transcript(self, video_id, transcript_data, db_handler=None):
         logger.info(f"Processing transcript for video {video_id}")
         
         if not transcript_data:
@@ -57,7 +102,7 @@ class DataProcessor:
 
         logger.info(f"Number of transcript segments: {len(transcript)}")
 
-        full_transcript = " ".join([segment.get('text', '') for segment in transcript])
+        full_transcript = " ".join(segment.get('text', '') for segment in transcript)
         logger.debug(f"Full transcript length before cleaning: {len(full_transcript)}")
         logger.debug(f"Full transcript sample before cleaning: '{full_transcript[:500]}...'")
 
@@ -88,9 +133,10 @@ class DataProcessor:
             logger.debug(f"Document {field} length: {len(str(doc.get(field, '')))}")
             logger.debug(f"Document {field} sample: '{str(doc.get(field, ''))[:100]}...'")
 
-        self.documents.append(doc)
-        embedding = self.embedding_model.encode(cleaned_transcript + " " + metadata.get('title', ''))
-        self.embeddings.append(embedding)
+        embedding = self.embed_document(video_id, cleaned_transcript + " " + metadata.get('title', ''), db_handler)
+        with self.lock:
+            self.documents.append(doc)
+            self.embeddings.append(embedding)
 
         logger.info(f"Processed transcript for video {video_id}")
         
@@ -102,6 +148,10 @@ class DataProcessor:
         }
 
     def build_index(self, index_name):
+        with self.lock:
+            return self.build_index_locked(index_name)
+
+    def build_index_locked(self, index_name):
         if not self.documents:
             logger.error("No documents to index")
             return None
@@ -145,7 +195,14 @@ class DataProcessor:
                 self.es.indices.create(index=index_name, body={
                     "mappings": {
                         "properties": {
-                            "embedding": {"type": "dense_vector", "dims": len(self.embeddings[0]), "index": True, "similarity": "cosine"},
+                            "embedding": {
+                                "type": "dense_vector",
+                                "dims": len(self.embeddings[0]),
+                                "index": True,
+                                "similarity": "cosine",
+                                # Quantize the HNSW graph to int8; the float vectors are kept for rescoring
+                                "index_options": {"type": "int8_hnsw"}
+                            },
                             "content": {"type": "text"},
                             "title": {"type": "text"},
                             "description": {"type": "text"},
@@ -162,10 +219,15 @@ class DataProcessor:
                 })
                 logger.info(f"Created Elasticsearch index: {index_name}")
 
-            for doc, embedding in zip(self.documents, self.embeddings):
-                doc_with_embedding = doc.copy()
-                doc_with_embedding['embedding'] = embedding.tolist()
-                self.es.index(index=index_name, body=doc_with_embedding, id=doc['segment_id'])
+            actions = [
+                {
+                    "_index": index_name,
+                    "_id": doc['segment_id'],
+                    "_source": {**doc, "embedding": embedding.tolist()}
+                }
+                for doc, embedding in zip(self.documents, self.embeddings)
+            ]
+            helpers.bulk(self.es, actions)
             
             logger.info(f"Successfully indexed {len(self.documents)} documents in Elasticsearch")
             self.current_index_name = index_name
@@ -177,12 +239,12 @@ class DataProcessor:
     def compute_rrf(self, rank, k=60):
         return 1 / (k + rank)
 
-    def hybrid_search(self, query, index_name, num_results=5):
+    def hybrid_search(self, query, index_name, num_results=5, query_vector=None):
         if not index_name:
             logger.error("No index name provided for hybrid search.")
             raise ValueError("No index name provided for hybrid search.")
         
-        vector = self.embedding_model.encode(query)
+        vector = self.embedding_model.encode(query) if query_vector is None else query_vector
         
         knn_query = {
             "field": "embedding",
@@ -199,47 +261,51 @@ class DataProcessor:
         }
 
         try:
-            knn_results = self.es.search(
-                index=index_name, 
-                body={
-                    "knn": knn_query, 
-                    "size": 10
-                }
-            )['hits']['hits']
-            
-            keyword_results = self.es.search(
-                index=index_name, 
-                body={
-                    "query": keyword_query, 
-                    "size": 10
-                }
-            )['hits']['hits']
-            
-            rrf_scores = {}
-            for rank, hit in enumerate(knn_results):
-                doc_id = hit['_id']
-                rrf_scores[doc_id] = self.compute_rrf(rank + 1)
+            if self.server_side_rrf:
+                try:
+                    response = self.es.search(
+                        index=index_name,
+                        body={
+                            "query": keyword_query,
+                            "knn": knn_query,
+                            "rank": {"rrf": {"window_size": max(10, num_results), "rank_constant": 60}},
+                            "size": num_results
+                        }
+                    )
+                    return [hit['_source'] for hit in response['hits']['hits']]
+                except ApiError as e:
+                    # RRF requires an Elasticsearch license tier the default deployment doesn't have;
+                    # any other error is a problem with this query and must not disable RRF
+                    reason = str(e).lower()
+                    if e.meta.status != 403 and 'license' not in reason and 'rank' not in reason:
+                        raise
+                    logger.warning(f"Server-side RRF unavailable, fusing results client-side: {str(e)}")
+                    self.server_side_rrf = False
+
+            # Run both searches in one round trip and fuse their rankings here
+            knn_response, keyword_response = self.es.msearch(body=[
+                {"index": index_name}, {"knn": knn_query, "size": 10},
+                {"index": index_name}, {"query": keyword_query, "size": 10}
+            ])['responses']
+            for response in (knn_response, keyword_response):
+                if 'error' in response:
+                    raise RuntimeError(response['error'])
 
-            for rank, hit in enumerate(keyword_results):
-                doc_id = hit['_id']
-                if doc_id in rrf_scores:
-                    rrf_scores[doc_id] += self.compute_rrf(rank + 1)
-                else:
-                    rrf_scores[doc_id] = self.compute_rrf(rank + 1)
+            rrf_scores = {}
+            sources = {}
+            for results in (knn_response['hits']['hits'], keyword_response['hits']['hits']):
+                for rank, hit in enumerate(results):
+                    doc_id = hit['_id']
+                    rrf_scores[doc_id] = rrf_scores.get(doc_id, 0) + self.compute_rrf(rank + 1)
+                    sources[doc_id] = hit['_source']
 
             reranked_docs = sorted(rrf_scores.items(), key=lambda x: x[1], reverse=True)
-            
-            final_results = []
-            for doc_id, score in reranked_docs[:num_results]:
-                doc = self.es.get(index=index_name, id=doc_id)
-                final_results.append(doc['_source'])
-            
-            return final_results
+            return [sources[doc_id] for doc_id, score in reranked_docs[:num_results]]
         except Exception as e:
             logger.error(f"Error in hybrid search: {str(e)}")
             raise
 
-    def search(self, query, filter_dict={}, boost_dict={}, num_results=10, method='hybrid', index_name=None):
+    def search(self, query, filter_dict={}, boost_dict={}, num_results=10, method='hybrid', index_name=None, query_vector=None):
         if not index_name:
             logger.error("No index name provided for search.")
             raise ValueError("No index name provided for search.")
@@ -254,9 +320,9 @@ class DataProcessor:
             if method == 'text':
                 return self.text_search(query, filter_dict, boost_dict, num_results, index_name)
             elif method == 'embedding':
-                return self.embedding_search(query, num_results, index_name)
+                return self.embedding_search(query, num_results, index_name, query_vector)
             else:  # hybrid search
-                return self.hybrid_search(query, index_name, num_results)
+                return self.hybrid_search(query, index_name, num_results, query_vector)
         except Exception as e:
             logger.error(f"Error in search method {method}: {str(e)}")
             raise
@@ -282,19 +348,20 @@ class DataProcessor:
             logger.error(f"Error in text search: {str(e)}")
             raise
 
-    def embedding_search(self, query, num_results=10, index_name=None):
+    def embedding_search(self, query, num_results=10, index_name=None, query_vector=None):
         if not index_name:
             logger.error("No index name provided for embedding search.")
             raise ValueError("No index name provided for embedding search.")
         
         try:
-            query_vector = self.embedding_model.encode(query).tolist()
+            if query_vector is None:
+                query_vector = self.embedding_model.encode(query)
             script_query = {
                 "script_score": {
                     "query": {"match_all": {}},
                     "script": {
                         "source": "cosineSimilarity(params.query_vector, 'embedding') + 1.0",
-                        "params": {"query_vector": query_vector}
+                        "params": {"query_vector": query_vector.tolist()}
                     }
                 }
             }
@@ -312,5 +379,6 @@ class DataProcessor:
             raise
     
     def set_embedding_model(self, model_name):
-        self.embedding_model = SentenceTransformer(model_name)
+        self.embedding_model_name = model_name
+        self.embedding_model = load_embedding_model(model_name)
         logger.info(f"Embedding model set to: {model_name}")
\ No newline at end of file
@@ -1,6 +1,8 @@
 import sqlite3
 import os
 import logging
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 
 logging.basicConfig(level=logging.INFO)
@@ -10,13 +12,64 @@ class DatabaseHandler:
     def __init__(self, db_path='data/sqlite.db'):
         self.db_path = db_path
         self.conn = None
+        self.local = threading.local()
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.enable_wal()
         self.create_tables()
         self.update_schema()
         self.migrate_database()
 
-    def create_tables(self):
+    def enable_wal(self):
+        # WAL lets readers proceed while a write transaction is open and only
+        # needs an fsync at checkpoints; the journal mode persists in the file
         with sqlite3.connect(self.db_path) as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+
+    def configure_connection(self, conn):
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA temp_store=MEMORY')
+
+    @contextmanager
+    def connection(self):
+        """Yield the connection of the active transaction, or a new one that commits on exit"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is not None:
+            yield conn
+            return
+
+        conn = sqlite3.connect(self.db_path)
+        self.configure_connection(conn)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def transaction(self):
+        """Run every DatabaseHandler call in the block inside one BEGIN IMMEDIATE/COMMIT"""
+        if getattr(self.local, 'conn', None) is not None:
+            # Nested transaction blocks join the outer one
+            yield self.local.conn
+            return
+
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        self.configure_connection(conn)
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            self.local.conn = conn
+            try:
+                yield conn
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        finally:
+            self.local.conn = None
+            conn.close()
+
+    def create_tables(self):
+        with self.connection() as conn:
             cursor = conn.cursor()
             
             # First, drop the existing user_feedback table if it exists
@@ -102,6 +155,19 @@ class DatabaseHandler:
                 )
             ''')
             
+            # Embeddings cache table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    video_id TEXT,
+                    model_name TEXT,
+                    content_hash TEXT,
+                    embedding BLOB,
+                    UNIQUE(video_id, model_name, content_hash),
+                    FOREIGN KEY (video_id) REFERENCES videos (youtube_id)
+                )
+            ''')
+            
             # Ground Truth table
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS ground_truth (
@@ -152,11 +218,9 @@ class DatabaseHandler:
                     FOREIGN KEY (video_id) REFERENCES videos (youtube_id)
                 )
             ''')
-            
-            conn.commit()
 
     def update_schema(self):
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connection() as conn:
             cursor = conn.cursor()
             
             # Check and update videos table
@@ -175,13 +239,11 @@ class DatabaseHandler:
             for col_name, col_type in new_columns:
                 if col_name not in columns:
                     cursor.execute(f"ALTER TABLE videos ADD COLUMN {col_name} {col_type}")
-            
-            conn.commit()
 
     # Video Management Methods
     def add_video(self, video_data):
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     INSERT OR REPLACE INTO videos 
@@ -199,20 +261,27 @@ class DatabaseHandler:
                     video_data['video_duration'],
                     video_data['transcript_content']
                 ))
-                conn.commit()
                 return cursor.lastrowid
         except Exception as e:
             logger.error(f"Error adding video: {str(e)}")
             raise
 
     def get_video_by_youtube_id(self, youtube_id):
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connection() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT * FROM videos WHERE youtube_id = ?', (youtube_id,))
             return cursor.fetchone()
 
+    def get_video_details(self, youtube_id):
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            cursor.execute('SELECT * FROM videos WHERE youtube_id = ?', (youtube_id,))
+            result = cursor.fetchone()
+            return dict(result) if result else None
+
     def get_all_videos(self):
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT youtube_id, title, channel_name, upload_date
@@ -223,17 +292,16 @@ class DatabaseHandler:
 
     # Chat and Feedback Methods
     def add_chat_message(self, video_id, user_message, assistant_message):
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO chat_history (video_id, user_message, assistant_message)
                 VALUES (?, ?, ?)
             ''', (video_id, user_message, assistant_message))
-            conn.commit()
             return cursor.lastrowid
 
     def get_chat_history(self, video_id):
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT id, user_message, assistant_message, timestamp
@@ -245,7 +313,7 @@ class DatabaseHandler:
 
     def add_user_feedback(self, video_id, chat_id, query, response, feedback):
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connection() as conn:
                 cursor = conn.cursor()
                 
                 # First verify the video exists
@@ -267,7 +335,6 @@ class DatabaseHandler:
                     (video_id, chat_id, query, response, feedback)
                     VALUES (?, ?, ?, ?, ?)
                 ''', (video_id, chat_id, query, response, feedback))
-                conn.commit()
                 logger.info(f"Added feedback for video {video_id}, chat {chat_id}")
                 return cursor.lastrowid
         except sqlite3.Error as e:
@@ -279,7 +346,7 @@ class DatabaseHandler:
 
     def get_user_feedback_stats(self, video_id):
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     SELECT 
@@ -295,26 +362,24 @@ class DatabaseHandler:
 
     # Embedding and Index Methods
     def add_embedding_model(self, model_name, description):
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT OR IGNORE INTO embedding_models (model_name, description)
                 VALUES (?, ?)
             ''', (model_name, description))
-            conn.commit()
             return cursor.lastrowid
 
     def add_elasticsearch_index(self, video_id, index_name, embedding_model_id):
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO elasticsearch_indices (video_id, index_name, embedding_model_id)
                 VALUES (?, ?, ?)
             ''', (video_id, index_name, embedding_model_id))
-            conn.commit()
 
     def get_elasticsearch_index(self, video_id, embedding_model):
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT ei.index_name 
@@ -327,7 +392,7 @@ class DatabaseHandler:
             return result[0] if result else None
 
     def get_elasticsearch_index_by_youtube_id(self, youtube_id):
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT ei.index_name 
@@ -338,9 +403,27 @@ class DatabaseHandler:
             result = cursor.fetchone()
             return result[0] if result else None
 
+    def add_embedding(self, video_id, model_name, content_hash, embedding):
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT OR REPLACE INTO embeddings (video_id, model_name, content_hash, embedding)
+                VALUES (?, ?, ?, ?)
+            ''', (video_id, model_name, content_hash, embedding))
+
+    def get_embedding(self, video_id, model_name, content_hash):
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT embedding FROM embeddings
+                WHERE video_id = ? AND model_name = ? AND content_hash = ?
+            ''', (video_id, model_name, content_hash))
+            result = cursor.fetchone()
+            return result[0] if result else None
+
     # Ground Truth Methods
     def add_ground_truth_questions(self, video_id, questions):
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connection() as conn:
             cursor = conn.cursor()
             for question in questions:
                 try:
@@ -350,10 +433,9 @@ class DatabaseHandler:
                     ''', (video_id, question))
                 except sqlite3.IntegrityError:
                     continue  # Skip duplicate questions
-            conn.commit()
 
     def get_ground_truth_by_video(self, video_id):
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT gt.*, v.channel_name
@@ -365,7 +447,7 @@ class DatabaseHandler:
             return cursor.fetchall()
 
     def get_ground_truth_by_channel(self, channel_name):
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT gt.*, v.channel_name
@@ -377,7 +459,7 @@ class DatabaseHandler:
             return cursor.fetchall()
 
     def get_all_ground_truth(self):
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT gt.*, v.channel_name
@@ -389,26 +471,24 @@ class DatabaseHandler:
 
     # Evaluation Methods
     def save_search_performance(self, video_id, hit_rate, mrr):
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO search_performance (video_id, hit_rate, mrr)
                 VALUES (?, ?, ?)
             ''', (video_id, hit_rate, mrr))
-            conn.commit()
 
     def save_search_parameters(self, video_id, parameters, score):
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connection() as conn:
             cursor = conn.cursor()
             for param_name, param_value in parameters.items():
                 cursor.execute('''
                     INSERT INTO search_parameters (video_id, parameter_name, parameter_value, score)
                     VALUES (?, ?, ?, ?)
                 ''', (video_id, param_name, param_value, score))
-            conn.commit()
 
     def save_rag_evaluation(self, evaluation_data):
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO rag_evaluations 
@@ -421,10 +501,20 @@ class DatabaseHandler:
                 evaluation_data['relevance'],
                 evaluation_data['explanation']
             ))
-            conn.commit()
+
+    def save_rag_evaluations(self, evaluations):
+        with self.transaction() as conn:
+            conn.executemany('''
+                INSERT INTO rag_evaluations 
+                (video_id, question, answer, relevance, explanation)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [
+                (e['video_id'], e['question'], e['answer'], e['relevance'], e['explanation'])
+                for e in evaluations
+            ])
 
     def get_latest_evaluation_results(self, video_id=None):
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connection() as conn:
             cursor = conn.cursor()
             if video_id:
                 cursor.execute('''
@@ -440,7 +530,7 @@ class DatabaseHandler:
             return cursor.fetchall()
 
     def get_latest_search_performance(self, video_id=None):
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connection() as conn:
             cursor = conn.cursor()
             if video_id:
                 cursor.execute('''
@@ -458,7 +548,7 @@ class DatabaseHandler:
         
     def migrate_database(self):
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connection() as conn:
                 cursor = conn.cursor()
                 
                 # Check if chat_id column exists in user_feedback
@@ -495,8 +585,6 @@ class DatabaseHandler:
                     cursor.execute('ALTER TABLE user_feedback_new RENAME TO user_feedback')
                     
                     logger.info("Migration completed successfully")
-                
-                conn.commit()
         except Exception as e:
             logger.error(f"Error during migration: {str(e)}")
             raise
\ No newline at end of file
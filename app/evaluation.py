@@ -1,12 +1,28 @@
 from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
-import pandas as pd
 import json
 import ollama
 import requests
-import sqlite3
 from tqdm import tqdm
 import csv
+import os
+from generate_ground_truth import load_ground_truth
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Number of ground truth questions evaluated concurrently. Ollama serves up to
+# OLLAMA_NUM_PARALLEL requests at once; more workers than that only queue on the
+# server, so the default matches it.
+EVALUATION_MAX_WORKERS = int(os.getenv('EVALUATION_MAX_WORKERS', os.getenv('OLLAMA_NUM_PARALLEL', 4)))
+
+# JSON schema the judge's output is constrained to, so every reply parses
+EVALUATION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "Relevance": {"type": "string", "enum": ["NON_RELEVANT", "PARTLY_RELEVANT", "RELEVANT"]},
+        "Explanation": {"type": "string"}
+    },
+    "required": ["Relevance", "Explanation"]
+}
 
 class EvaluationSystem:
     def __init__(self, data_processor, database_handler):
@@ -15,14 +31,13 @@ class EvaluationSystem:
 
     def relevance_scoring(self, query, retrieved_docs, top_k=5):
         query_embedding = self.data_processor.embedding_model.encode(query)
-        doc_embeddings = [self.data_processor.embedding_model.encode(doc['content']) for doc in retrieved_docs]
+        doc_embeddings = self.data_processor.embedding_model.encode([doc['content'] for doc in retrieved_docs])
         
         similarities = cosine_similarity([query_embedding], doc_embeddings)[0]
         return np.mean(sorted(similarities, reverse=True)[:top_k])
 
     def answer_similarity(self, generated_answer, reference_answer):
-        gen_embedding = self.data_processor.embedding_model.encode(generated_answer)
-        ref_embedding = self.data_processor.embedding_model.encode(reference_answer)
+        gen_embedding, ref_embedding = self.data_processor.embedding_model.encode([generated_answer, reference_answer])
         return cosine_similarity([gen_embedding], [ref_embedding])[0][0]
 
     def human_evaluation(self, video_id, query):
@@ -60,7 +75,9 @@ class EvaluationSystem:
         try:
             response = ollama.chat(
                 model='phi3.5',
-                messages=[{"role": "user", "content": prompt}]
+                messages=[{"role": "user", "content": prompt}],
+                format=EVALUATION_SCHEMA,
+                options={"temperature": 0, "num_predict": 512}
             )
             evaluation = json.loads(response['message']['content'])
             return evaluation
@@ -68,50 +85,75 @@ class EvaluationSystem:
             print(f"Error in LLM evaluation: {str(e)}")
             return None
 
-    def evaluate_rag(self, rag_system, ground_truth_file, prompt_template=None):
+    def encode_questions(self, questions):
+        """Embed all questions in one batched forward pass, keyed by question text"""
+        questions = list(dict.fromkeys(questions))
+        vectors = self.data_processor.embedding_model.encode(questions, batch_size=64, show_progress_bar=False)
+        return dict(zip(questions, vectors))
+
+    def evaluate_single_question(self, rag_system, row, prompt_template=None, query_vector=None):
+        question = row['question']
+        video_id = row['video_id']
+
+        index_name = self.db_handler.get_elasticsearch_index_by_youtube_id(video_id)
+
+        if not index_name:
+            print(f"No index found for video {video_id}. Skipping this question.")
+            return None
+
         try:
-            ground_truth = pd.read_csv(ground_truth_file)
+            answer_llm, _ = rag_system.query(
+                question, search_method='hybrid', index_name=index_name, query_vector=query_vector, raise_errors=True
+            )
+        except Exception as e:
+            print(f"Error querying RAG system: {str(e)}")
+            return None
+
+        if prompt_template:
+            evaluation = self.llm_as_judge(question, answer_llm, prompt_template)
+            if not evaluation:
+                return None
+            return {
+                'video_id': str(video_id),
+                'question': str(question),
+                'answer': str(answer_llm),
+                'relevance': str(evaluation.get('Relevance', 'UNKNOWN')),
+                'explanation': str(evaluation.get('Explanation', 'No explanation provided'))
+            }
+
+        similarity = self.answer_similarity(answer_llm, row.get('reference_answer', ''))
+        return {
+            'video_id': str(video_id),
+            'question': str(question),
+            'answer': str(answer_llm),
+            'relevance': f"Similarity: {similarity}",
+            'explanation': "Cosine similarity used for evaluation"
+        }
+
+    def evaluate_rag(self, rag_system, ground_truth_file, prompt_template=None, question_vectors=None):
+        try:
+            ground_truth = load_ground_truth(ground_truth_file)
         except FileNotFoundError:
             print("Ground truth file not found. Please generate ground truth data first.")
             return None
 
-        evaluations = []
+        rows = ground_truth.to_dict(orient='records')
+        if question_vectors is None:
+            question_vectors = self.encode_questions(row['question'] for row in rows)
+        results = [None] * len(rows)
 
-        for _, row in tqdm(ground_truth.iterrows(), total=len(ground_truth)):
-            question = row['question']
-            video_id = row['video_id']
-            
-            index_name = self.db_handler.get_elasticsearch_index_by_youtube_id(video_id)
-            
-            if not index_name:
-                print(f"No index found for video {video_id}. Skipping this question.")
-                continue
-
-            try:
-                answer_llm, _ = rag_system.query(question, search_method='hybrid', index_name=index_name)
-            except ValueError as e:
-                print(f"Error querying RAG system: {str(e)}")
-                continue
-
-            if prompt_template:
-                evaluation = self.llm_as_judge(question, answer_llm, prompt_template)
-                if evaluation:
-                    evaluations.append({
-                        'video_id': str(video_id),
-                        'question': str(question),
-                        'answer': str(answer_llm),
-                        'relevance': str(evaluation.get('Relevance', 'UNKNOWN')),
-                        'explanation': str(evaluation.get('Explanation', 'No explanation provided'))
-                    })
-            else:
-                similarity = self.answer_similarity(answer_llm, row.get('reference_answer', ''))
-                evaluations.append({
-                    'video_id': str(video_id),
-                    'question': str(question),
-                    'answer': str(answer_llm),
-                    'relevance': f"Similarity: {similarity}",
-                    'explanation': "Cosine similarity used for evaluation"
-                })
+        with ThreadPoolExecutor(max_workers=EVALUATION_MAX_WORKERS) as executor:
+            futures = {
+                executor.submit(
+                    self.evaluate_single_question, rag_system, row, prompt_template, question_vectors[row['question']]
+                ): i
+                for i, row in enumerate(rows)
+            }
+            for future in tqdm(as_completed(futures), total=len(futures)):
+                results[futures[future]] = future.result()
+
+        # Keep the ground truth order regardless of completion order
+        evaluations = [evaluation for evaluation in results if evaluation is not None]
 
         # Save evaluations to CSV
         csv_path = 'data/evaluation_results.csv'
@@ -130,39 +172,26 @@ class EvaluationSystem:
         return evaluations
 
     def save_evaluations_to_db(self, evaluations):
-        with sqlite3.connect(self.db_handler.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS rag_evaluations (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                video_id TEXT,
-                question TEXT,
-                answer TEXT,
-                relevance TEXT,
-                explanation TEXT
-            )
-            ''')
-            for eval_data in evaluations:
-                cursor.execute('''
-                INSERT INTO rag_evaluations (video_id, question, answer, relevance, explanation)
-                VALUES (?, ?, ?, ?, ?)
-                ''', (eval_data['video_id'], eval_data['question'], eval_data['answer'], 
-                      eval_data['relevance'], eval_data['explanation']))
-            conn.commit()
+        self.db_handler.save_rag_evaluations(evaluations)
         print("Evaluation results saved to database")
 
     def run_full_evaluation(self, rag_system, ground_truth_file, prompt_template=None):
         # Load ground truth
-        ground_truth = pd.read_csv(ground_truth_file)
+        ground_truth = load_ground_truth(ground_truth_file)
+
+        # Embed every question once; the searches below run over the same set many times
+        question_vectors = self.encode_questions(ground_truth['question'])
 
         # Evaluate RAG
-        rag_evaluations = self.evaluate_rag(rag_system, ground_truth_file, prompt_template)
+        rag_evaluations = self.evaluate_rag(rag_system, ground_truth_file, prompt_template, question_vectors)
 
         # Evaluate search performance
         def search_function(query, video_id):
             index_name = self.db_handler.get_elasticsearch_index_by_youtube_id(video_id)
             if index_name:
-                return rag_system.data_processor.search(query, num_results=10, method='hybrid', index_name=index_name)
+                return rag_system.data_processor.search(
+                    query, num_results=10, method='hybrid', index_name=index_name, query_vector=question_vectors[query]
+                )
             return []
 
         search_performance = self.evaluate_search(ground_truth, search_function)
@@ -174,7 +203,10 @@ class EvaluationSystem:
             def parameterized_search(query, video_id):
                 index_name = self.db_handler.get_elasticsearch_index_by_youtube_id(video_id)
                 if index_name:
-                    return rag_system.data_processor.search(query, num_results=10, method='hybrid', index_name=index_name, boost_dict=params)
+                    return rag_system.data_processor.search(
+                        query, num_results=10, method='hybrid', index_name=index_name, boost_dict=params,
+                        query_vector=question_vectors[query]
+                    )
                 return []
             return self.evaluate_search(ground_truth, parameterized_search)['mrr']
 
@@ -216,7 +248,7 @@ class EvaluationSystem:
 
     def evaluate_search(self, ground_truth, search_function):
         relevance_total = []
-        for _, row in tqdm(ground_truth.iterrows(), total=len(ground_truth)):
+        for row in tqdm(ground_truth.to_dict(orient='records')):
             video_id = row['video_id']
             results = search_function(row['question'], video_id)
             relevance = [d['video_id'] == video_id for d in results]
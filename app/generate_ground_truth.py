@@ -7,10 +7,42 @@ import sqlite3
 import logging
 import os
 import re
+import math
+import streamlit as st
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Transcript characters sent per question-generation prompt (roughly 4 characters
+# per token); longer transcripts are split so the model doesn't silently truncate them
+MAX_TRANSCRIPT_CHARS = int(os.getenv('MAX_TRANSCRIPT_CHARS', 6000))
+
+def questions_schema(num_questions):
+    # JSON schema the generated questions are constrained to, so every reply parses
+    return {
+        "type": "object",
+        "properties": {
+            "questions": {"type": "array", "items": {"type": "string"}, "minItems": num_questions}
+        },
+        "required": ["questions"]
+    }
+
+def split_transcript(transcript, max_chars=MAX_TRANSCRIPT_CHARS):
+    """Split a transcript on word boundaries into pieces of at most max_chars"""
+    chunks = []
+    start = 0
+    while start < len(transcript):
+        end = start + max_chars
+        if end < len(transcript):
+            space = transcript.rfind(' ', start, end)
+            if space > start:
+                end = space
+        chunk = transcript[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        start = end
+    return chunks
+
 def extract_model_name(index_name):
     # Extract the model name from the index name
     match = re.search(r'video_[^_]+_(.+)$', index_name)
@@ -18,6 +50,14 @@ def extract_model_name(index_name):
         return match.group(1)
     return None
 
+@st.cache_data(ttl=300, show_spinner=False)
+def read_ground_truth(csv_path, mtime):
+    return pd.read_csv(csv_path)
+
+def load_ground_truth(csv_path='data/ground-truth-retrieval.csv'):
+    """Load the ground truth CSV, re-parsing it only after the file has been rewritten"""
+    return read_ground_truth(csv_path, os.path.getmtime(csv_path))
+
 def get_transcript_from_elasticsearch(es, index_name, video_id):
     try:
         result = es.search(index=index_name, body={
@@ -46,13 +86,13 @@ def get_transcript_from_sqlite(db_path, video_id):
         logger.error(f"Error retrieving transcript from SQLite: {str(e)}")
     return None
 
-def generate_questions(transcript, max_retries=3):
+def generate_questions(transcript, max_retries=3, num_questions=10):
     prompt_template = """
     You are an AI assistant tasked with generating questions based on a YouTube video transcript.
-    Formulate EXACTLY 10 questions that a user might ask based on the provided transcript.
+    Formulate EXACTLY {num_questions} {question_label} that a user might ask based on the provided transcript.
     Make the questions specific to the content of the transcript.
     The questions should be complete and not too short. Use as few words as possible from the transcript.
-    Ensure that all 10 questions are unique and not repetitive.
+    Ensure that all questions are unique and not repetitive.
 
     The transcript:
 
@@ -60,29 +100,44 @@ def generate_questions(transcript, max_retries=3):
 
     Provide the output in parsable JSON without using code blocks:
 
-    {{"questions": ["question1", "question2", ..., "question10"]}}
+    {{"questions": ["question1", "question2", ...]}}
     """.strip()
 
+    # Long transcripts are covered piece by piece, asking each piece for its share of questions
+    chunks = split_transcript(transcript) or [transcript]
+    if len(chunks) > num_questions:
+        # At most one piece per question, sampled evenly across the video
+        step = len(chunks) / num_questions
+        chunks = [chunks[int(i * step)] for i in range(num_questions)]
+    questions_per_chunk = math.ceil(num_questions / len(chunks))
+    question_label = "question" if questions_per_chunk == 1 else "questions"
+
     all_questions = set()
     retries = 0
 
-    while len(all_questions) < 10 and retries < max_retries:
-        prompt = prompt_template.format(transcript=transcript)
-        try:
-            response = ollama.chat(
-                model='phi3.5',
-                messages=[{"role": "user", "content": prompt}]
+    while len(all_questions) < num_questions and retries < max_retries:
+        for chunk in chunks:
+            if len(all_questions) >= num_questions:
+                break
+            prompt = prompt_template.format(
+                transcript=chunk, num_questions=questions_per_chunk, question_label=question_label
             )
-            questions = json.loads(response['message']['content'])['questions']
-            all_questions.update(questions)
-        except Exception as e:
-            logger.error(f"Error generating questions: {str(e)}")
+            try:
+                response = ollama.chat(
+                    model='phi3.5',
+                    messages=[{"role": "user", "content": prompt}],
+                    format=questions_schema(questions_per_chunk)
+                )
+                questions = json.loads(response['message']['content'])['questions']
+                all_questions.update(questions)
+            except Exception as e:
+                logger.error(f"Error generating questions: {str(e)}")
         retries += 1
 
-    if len(all_questions) < 10:
+    if len(all_questions) < num_questions:
         logger.warning(f"Could only generate {len(all_questions)} unique questions after {max_retries} attempts.")
 
-    return {"questions": list(all_questions)[:10]}
+    return {"questions": list(all_questions)[:num_questions]}
 
 def generate_ground_truth(db_handler, data_processor, video_id):
     es = Elasticsearch([f'http://{os.getenv("ELASTICSEARCH_HOST", "localhost")}:{os.getenv("ELASTICSEARCH_PORT", "9200")}'])
@@ -155,7 +210,7 @@ def get_ground_truth_display_data(db_handler, video_id=None, channel_name=None):
     
     # Try to get data from CSV
     try:
-        csv_df = pd.read_csv('data/ground-truth-retrieval.csv')
+        csv_df = load_ground_truth()
         if video_id:
             csv_df = csv_df[csv_df['video_id'] == video_id]
         elif channel_name:
@@ -127,13 +127,12 @@ def create_chat_interface(db_handler, rag_system, video_id, index_name, rewrite_
                         "Embedding-only": "embedding"
                     }
                     
-                    response, _ = rag_system.query(
+                    # Stream the answer so it renders as soon as the first tokens arrive
+                    response = st.write_stream(rag_system.query_stream(
                         rewritten_query,
                         search_method=search_method_map[search_method],
                         index_name=index_name
-                    )
-                    
-                    st.markdown(response)
+                    ))
                     
                     # Save to database and session state
                     chat_id = db_handler.add_chat_message(video_id, prompt, response)
@@ -7,15 +7,20 @@ st.set_page_config(
     layout="wide"
 )
 
-import pandas as pd
-from transcript_extractor import get_transcript, extract_video_id, get_channel_videos
+from transcript_extractor import extract_video_id, get_channel_videos
 from database import DatabaseHandler
 from data_processor import DataProcessor
-from utils import process_single_video
+from utils import process_single_video, load_videos_df
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
+# Videos of a channel processed concurrently; most of the work is waiting on
+# the YouTube API, Elasticsearch and SQLite
+INGESTION_MAX_WORKERS = int(os.getenv('INGESTION_MAX_WORKERS', 8))
+
 @st.cache_resource
 def init_components():
     return DatabaseHandler(), DataProcessor()
@@ -25,13 +30,27 @@ def process_multiple_videos(db_handler, data_processor, video_ids, embedding_mod
     processed = 0
     total = len(video_ids)
     
-    for video_id in video_ids:
-        if process_single_video(db_handler, data_processor, video_id, embedding_model):
-            processed += 1
-        progress_bar.progress(processed / total)
+    with ThreadPoolExecutor(max_workers=INGESTION_MAX_WORKERS) as executor:
+        futures = [
+            executor.submit(process_single_video, db_handler, data_processor, video_id, embedding_model)
+            for video_id in video_ids
+        ]
+        # Streamlit calls stay on the script thread
+        for completed, future in enumerate(as_completed(futures), 1):
+            if future.result():
+                processed += 1
+            progress_bar.progress(completed / total)
     
     st.success(f"Processed {processed} out of {total} videos")
 
+def process_video(db_handler, data_processor, video_id, embedding_model):
+    index_name = process_single_video(db_handler, data_processor, video_id, embedding_model)
+    if index_name:
+        st.success(f"Video {video_id} is indexed as {index_name}")
+    else:
+        st.error(f"Failed to process video {video_id}. Check the logs for details.")
+    return index_name
+
 def main():
     st.title("Data Ingestion 📥")
     
@@ -45,11 +64,8 @@ def main():
     
     # Display existing videos
     st.header("Processed Videos")
-    videos = db_handler.get_all_videos()
-    if videos:
-        video_df = pd.DataFrame(videos, columns=['youtube_id', 'title', 'channel_name', 'upload_date'])
-        channels = sorted(video_df['channel_name'].unique())
-        
+    video_df, channels = load_videos_df(db_handler)
+    if not video_df.empty:
         selected_channel = st.selectbox("Filter by Channel", ["All"] + channels)
         if selected_channel != "All":
             video_df = video_df[video_df['channel_name'] == selected_channel]
@@ -72,7 +88,7 @@ def main():
                 if input_type == "Video URL":
                     video_id = extract_video_id(input_value)
                     if video_id:
-                        process_single_video(db_handler, data_processor, video_id, embedding_model)
+                        process_video(db_handler, data_processor, video_id, embedding_model)
                 
                 elif input_type == "Channel URL":
                     channel_videos = get_channel_videos(input_value)
@@ -83,63 +99,10 @@ def main():
                         st.error("Failed to retrieve videos from the channel")
                 
                 else:  # YouTube ID
-                    process_single_video(db_handler, data_processor, input_value, embedding_model)
-
-def process_single_video(db_handler, data_processor, video_id, embedding_model):
-    try:
-        existing_index = db_handler.get_elasticsearch_index_by_youtube_id(video_id)
-        if existing_index:
-            st.info(f"Video {video_id} already processed. Using existing index.")
-            return existing_index
-        
-        transcript_data = get_transcript(video_id)
-        if not transcript_data:
-            st.error("Failed to retrieve transcript.")
-            return None
-            
-        # Process transcript and create indices
-        processed_data = data_processor.process_transcript(video_id, transcript_data)
-        if not processed_data:
-            st.error("Failed to process transcript.")
-            return None
+                    process_video(db_handler, data_processor, input_value, embedding_model)
             
-        # Save to database and create index
-        video_data = {
-            'video_id': video_id,
-            'title': transcript_data['metadata'].get('title', 'Unknown'),
-            'author': transcript_data['metadata'].get('author', 'Unknown'),
-            'upload_date': transcript_data['metadata'].get('upload_date', ''),
-            'view_count': transcript_data['metadata'].get('view_count', 0),
-            'like_count': transcript_data['metadata'].get('like_count', 0),
-            'comment_count': transcript_data['metadata'].get('comment_count', 0),
-            'video_duration': transcript_data['metadata'].get('duration', ''),
-            'transcript_content': processed_data['content']
-        }
-        
-        db_handler.add_video(video_data)
-        
-        index_name = f"video_{video_id}_{embedding_model}".lower()
-        index_name = data_processor.build_index(index_name)
-        
-        if index_name:
-            st.success(f"Successfully processed video: {video_data['title']}")
-            return index_name
-    except Exception as e:
-        st.error(f"Error processing video: {str(e)}")
-        logger.error(f"Error processing video {video_id}: {str(e)}")
-        return None
-
-def process_multiple_videos(db_handler, data_processor, video_ids, embedding_model):
-    progress_bar = st.progress(0)
-    processed = 0
-    total = len(video_ids)
-    
-    for video_id in video_ids:
-        if process_single_video(db_handler, data_processor, video_id, embedding_model):
-            processed += 1
-        progress_bar.progress(processed / total)
-    
-    st.success(f"Processed {processed} out of {total} videos")
+            # Show the newly processed videos on the next rerun
+            load_videos_df.clear()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -11,7 +11,7 @@ from database import DatabaseHandler
 from data_processor import DataProcessor
 from rag import RAGSystem
 from evaluation import EvaluationSystem
-from generate_ground_truth import get_evaluation_display_data
+from generate_ground_truth import get_evaluation_display_data, load_ground_truth
 import logging
 
 logger = logging.getLogger(__name__)
@@ -58,7 +58,7 @@ def main():
     
     try:
         # Check for ground truth data
-        ground_truth_df = pd.read_csv('data/ground-truth-retrieval.csv')
+        ground_truth_df = load_ground_truth()
         ground_truth_available = True
         
         # Display existing evaluations
@@ -6,10 +6,10 @@ st.set_page_config(
     layout="wide"
 )
 
-import pandas as pd
 from database import DatabaseHandler
 from data_processor import DataProcessor
 from generate_ground_truth import generate_ground_truth, get_ground_truth_display_data
+from utils import load_videos_df
 import logging
 
 logger = logging.getLogger(__name__)
@@ -24,15 +24,12 @@ def main():
     db_handler, data_processor = init_components()
     
     # Get all videos
-    videos = db_handler.get_all_videos()
-    if not videos:
+    video_df, channels = load_videos_df(db_handler)
+    if video_df.empty:
         st.warning("No videos available. Please process some videos in the Data Ingestion page first.")
         return
     
-    video_df = pd.DataFrame(videos, columns=['youtube_id', 'title', 'channel_name', 'upload_date'])
-    
     # Channel filter
-    channels = sorted(video_df['channel_name'].unique())
     selected_channel = st.selectbox("Filter by Channel", ["All"] + channels)
     
     if selected_channel != "All":
@@ -8,10 +8,12 @@ class QueryRewriter:
     def __init__(self):
         self.model = os.getenv('OLLAMA_MODEL', "phi3")
         self.ollama_host = os.getenv('OLLAMA_HOST', 'http://ollama:11434')
+        # One client per rewriter so every call reuses the same keep-alive connection pool
+        self.client = ollama.Client(host=self.ollama_host)
 
     def generate(self, prompt):
         try:
-            response = ollama.chat(
+            response = self.client.chat(
                 model=self.model,
                 messages=[{"role": "user", "content": prompt}]
             )
@@ -3,11 +3,19 @@ from dotenv import load_dotenv
 import ollama
 import logging
 import time
+import streamlit as st
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# Characters of retrieved context placed in the prompt (roughly 4 characters per
+# token), keeping the prompt inside the model's context window
+MAX_CONTEXT_CHARS = int(os.getenv('MAX_CONTEXT_CHARS', 6000))
+
+# Models already pulled by this process; every page builds its own RAGSystem
+PULLED_MODELS = set()
+
 # Define the RAG prompt template
 RAG_PROMPT_TEMPLATE = """
 You are an AI assistant analyzing YouTube video transcripts. Your task is to answer questions based on the provided transcript context.
@@ -27,6 +35,20 @@ Guidelines:
 5. Use natural, conversational language
 """.strip()
 
+# Split the template once around its placeholders; every prompt then shares a
+# byte-identical prefix that Ollama can serve from its prompt cache
+PROMPT_PREFIX, _, _rest = RAG_PROMPT_TEMPLATE.partition("{context}")
+PROMPT_MIDDLE, _, PROMPT_SUFFIX = _rest.partition("{question}")
+
+@st.cache_data(show_spinner=False, ttl=24 * 3600, max_entries=1024)
+def cached_generate(_rag_system, model, prompt):
+    """Memoize rewrite generations on (model, prompt) so replayed queries skip the LLM"""
+    response = _rag_system.generate(prompt)
+    if response is None:
+        # Raising keeps failed generations out of the cache
+        raise RuntimeError(f"Model {model} returned no response")
+    return response
+
 class RAGSystem:
     def __init__(self, data_processor):
         self.data_processor = data_processor
@@ -34,12 +56,16 @@ class RAGSystem:
         self.ollama_host = os.getenv('OLLAMA_HOST', 'http://ollama:11434')
         self.timeout = int(os.getenv('OLLAMA_TIMEOUT', 240))
         self.max_retries = int(os.getenv('OLLAMA_MAX_RETRIES', 3))
+        # One client per system so every call reuses the same keep-alive connection pool.
+        # No timeout, as with the module-level client: a read timeout would cover Ollama's
+        # queue wait plus the whole generation (or download, for pulls)
+        self.client = ollama.Client(host=self.ollama_host)
         
         self.check_ollama_service()
 
     def check_ollama_service(self):
         try:
-            ollama.list()
+            self.client.list()
             logger.info("Ollama service is accessible.")
             self.pull_model()
         except Exception as e:
@@ -47,8 +73,11 @@ class RAGSystem:
             logger.error(f"Please ensure Ollama is running and accessible at {self.ollama_host}")
 
     def pull_model(self):
+        if self.model in PULLED_MODELS:
+            return
         try:
-            ollama.pull(self.model)
+            self.client.pull(self.model)
+            PULLED_MODELS.add(self.model)
             logger.info(f"Successfully pulled model {self.model}.")
         except Exception as e:
             logger.error(f"Error pulling model {self.model}: {e}")
@@ -56,11 +85,11 @@ class RAGSystem:
     def generate(self, prompt):
         for attempt in range(self.max_retries):
             try:
-                response = ollama.chat(
+                response = self.client.chat(
                     model=self.model,
                     messages=[{"role": "user", "content": prompt}]
                 )
-                print("Printing the response from OLLAMA: "+response['message']['content'])
+                logger.debug("Ollama response length=%d", len(response['message']['content']))
                 return response['message']['content']
             except Exception as e:
                 logger.error(f"Error generating response on attempt {attempt + 1}: {e}")
@@ -70,26 +99,30 @@ class RAGSystem:
                 time.sleep(2 ** attempt)  # Exponential backoff
 
     def get_prompt(self, user_query, relevant_docs):
-        context = "\n".join([doc['content'] for doc in relevant_docs])
-        return RAG_PROMPT_TEMPLATE.format(
-            context=context,
-            question=user_query
+        context = "\n".join(doc['content'] for doc in relevant_docs)[:MAX_CONTEXT_CHARS]
+        return PROMPT_PREFIX + context + PROMPT_MIDDLE + user_query + PROMPT_SUFFIX
+
+    def retrieve_prompt(self, user_query, search_method='hybrid', index_name=None, query_vector=None):
+        if not index_name:
+            raise ValueError("No index name provided. Please select a video and ensure it has been processed.")
+
+        relevant_docs = self.data_processor.search(
+            user_query, num_results=3, method=search_method, index_name=index_name, query_vector=query_vector
         )
+        
+        if not relevant_docs:
+            logger.warning("No relevant documents found for the query.")
+            return None
 
-    def query(self, user_query, search_method='hybrid', index_name=None):
-        try:
-            if not index_name:
-                raise ValueError("No index name provided. Please select a video and ensure it has been processed.")
+        return self.get_prompt(user_query, relevant_docs)
 
-            relevant_docs = self.data_processor.search(user_query, num_results=3, method=search_method, index_name=index_name)
-            
-            if not relevant_docs:
-                logger.warning("No relevant documents found for the query.")
+    def query(self, user_query, search_method='hybrid', index_name=None, query_vector=None, raise_errors=False):
+        try:
+            prompt = self.retrieve_prompt(user_query, search_method, index_name, query_vector)
+            if not prompt:
                 return "I couldn't find any relevant information to answer your query.", ""
-
-            prompt = self.get_prompt(user_query, relevant_docs)
             
-            response = ollama.chat(
+            response = self.client.chat(
                 model=self.model,
                 messages=[{"role": "user", "content": prompt}]
             )
@@ -98,7 +131,28 @@ class RAGSystem:
             return answer, prompt
         except Exception as e:
             logger.error(f"An error occurred in the RAG system: {e}")
+            if raise_errors:
+                raise
             return f"An error occurred: {str(e)}", ""
+
+    def query_stream(self, user_query, search_method='hybrid', index_name=None):
+        """Same as query, but yields the answer piece by piece as Ollama generates it"""
+        try:
+            prompt = self.retrieve_prompt(user_query, search_method, index_name)
+            if not prompt:
+                yield "I couldn't find any relevant information to answer your query."
+                return
+
+            stream = self.client.chat(
+                model=self.model,
+                messages=[{"role": "user", "content": prompt}],
+                stream=True
+            )
+            for chunk in stream:
+                yield chunk['message']['content']
+        except Exception as e:
+            logger.error(f"An error occurred in the RAG system: {e}")
+            yield f"An error occurred: {str(e)}"
         
     def rewrite_cot(self, query):
         prompt = f"""Rewrite the following query using chain-of-thought reasoning:
@@ -106,10 +160,10 @@ class RAGSystem:
 Query: {query}
 
 Rewritten query:"""
-        response = self.generate(prompt)
-        if response:
-            return response, prompt
-        return query, prompt  # Return original query if rewriting fails
+        try:
+            return cached_generate(self, self.model, prompt), prompt
+        except RuntimeError:
+            return query, prompt  # Return original query if rewriting fails
 
     def rewrite_react(self, query):
         prompt = f"""Rewrite the following query using ReAct (Reasoning and Acting) approach:
@@ -117,7 +171,7 @@ Rewritten query:"""
 Query: {query}
 
 Rewritten query:"""
-        response = self.generate(prompt)
-        if response:
-            return response, prompt
-        return query, prompt  # Return original query if rewriting fails
\ No newline at end of file
+        try:
+            return cached_generate(self, self.model, prompt), prompt
+        except RuntimeError:
+            return query, prompt  # Return original query if rewriting fails
\ No newline at end of file
@@ -1,17 +1,55 @@
 import streamlit as st
+import pandas as pd
 from transcript_extractor import get_transcript
 import logging
 
 logger = logging.getLogger(__name__)
 
+@st.cache_data(ttl=60, show_spinner=False)
+def load_videos_df(_db_handler):
+    """Processed videos as a DataFrame plus their sorted channel names, cached across reruns"""
+    video_df = pd.DataFrame(_db_handler.get_all_videos(), columns=['youtube_id', 'title', 'channel_name', 'upload_date'])
+    channels = sorted(video_df['channel_name'].unique())
+    return video_df, channels
+
+def rebuild_index(db_handler, data_processor, video_id, index_name):
+    """Re-create a missing index from the stored transcript, reusing the cached embedding"""
+    video = db_handler.get_video_details(video_id)
+    if not video or not video['transcript_content']:
+        logger.error(f"No stored transcript for video {video_id}; cannot rebuild index {index_name}")
+        return None
+
+    # Same shape as get_transcript's output; the stored content is already cleaned,
+    # so the embedded text (and its cache key) matches the original ingest
+    transcript_data = {
+        'transcript': [{'text': video['transcript_content']}],
+        'metadata': {
+            'title': video['title'],
+            'author': video['channel_name'],
+            'upload_date': video['upload_date'],
+            'view_count': video['view_count'],
+            'like_count': video['like_count'],
+            'comment_count': video['comment_count'],
+            'duration': video['video_duration']
+        }
+    }
+    if not data_processor.process_transcript(video_id, transcript_data, db_handler):
+        logger.error(f"Failed to process stored transcript for video {video_id}")
+        return None
+
+    return data_processor.build_index(index_name)
+
 def process_single_video(db_handler, data_processor, video_id, embedding_model):
     """Process a single video for indexing"""
     try:
         # Check for existing index
         existing_index = db_handler.get_elasticsearch_index_by_youtube_id(video_id)
         if existing_index:
-            logger.info(f"Video {video_id} already processed. Using existing index.")
-            return existing_index
+            if data_processor.es.indices.exists(index=existing_index):
+                logger.info(f"Video {video_id} already processed. Using existing index.")
+                return existing_index
+            logger.warning(f"Index {existing_index} for video {video_id} is missing from Elasticsearch. Rebuilding it.")
+            return rebuild_index(db_handler, data_processor, video_id, existing_index)
         
         # Get transcript data
         transcript_data = get_transcript(video_id)
@@ -20,7 +58,7 @@ def process_single_video(db_handler, data_processor, video_id, embedding_model):
             return None
 
         # Process transcript
-        processed_data = data_processor.process_transcript(video_id, transcript_data)
+        processed_data = data_processor.process_transcript(video_id, transcript_data, db_handler)
         if not processed_data:
             logger.error(f"Failed to process transcript for video {video_id}")
             return None
@@ -38,19 +76,19 @@ def process_single_video(db_handler, data_processor, video_id, embedding_model):
             'transcript_content': processed_data['content']
         }
 
-        # Save to database
-        db_handler.add_video(video_data)
-
         # Build index
         index_name = f"video_{video_id}_{embedding_model}".lower()
         index_name = data_processor.build_index(index_name)
         
         if index_name:
-            # Save index information
-            embedding_model_id = db_handler.add_embedding_model(embedding_model, "Description of the model")
-            video_record = db_handler.get_video_by_youtube_id(video_id)
+            # Save video and index information in a single transaction
+            with db_handler.transaction():
+                db_handler.add_video(video_data)
+                embedding_model_id = db_handler.add_embedding_model(embedding_model, "Description of the model")
+                video_record = db_handler.get_video_by_youtube_id(video_id)
+                if video_record:
+                    db_handler.add_elasticsearch_index(video_record[0], index_name, embedding_model_id)
             if video_record:
-                db_handler.add_elasticsearch_index(video_record[0], index_name, embedding_model_id)
                 logger.info(f"Successfully processed video: {video_data['title']}")
                 return index_name
 